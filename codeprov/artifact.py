@@ -1,3 +1,4 @@
+import io
 import os
 import json
 import logging
@@ -6,7 +7,7 @@ import tarfile
 import shutil
 import requests
 
-from typing import Callable, BinaryIO
+from typing import Callable, BinaryIO, Iterable, Iterator
 from dataclasses import dataclass, asdict
 
 from tqdm.auto import tqdm
@@ -20,6 +21,7 @@ CODEPROV_HOME = os.path.expanduser(
 )
 CODEPROV_OFFLINE = os.getenv('CODEPROV_OFFLINE', '0') in ('1', 'yes')
 URL = 'https://github.com/Trussed-ai/codeprov-datasets/releases/download/{name}/{name}.tar.lzma'
+CHUNK_SIZE = 1 << 20
 
 logger = logging.getLogger(__name__)
 
@@ -51,8 +53,13 @@ class Metadata:
         self.manifest_path = os.path.join(self.path, 'manifest.json')
         self.digests_db_path = os.path.join(self.path, 'digests')
         self.digests_bloom_path = os.path.join(self.path, 'digests.bloom')
+        self.digests_mbloom_path = os.path.join(self.path, 'digests.mbloom')
+        self.digests_cuckoo_path = os.path.join(self.path, 'digests.cuckoo')
         self.digests_trie_path = os.path.join(self.path, 'digests.marisa')
+        self.digests_map_path = os.path.join(self.path, 'digests.map')
         self.sources_trie_path = os.path.join(self.path, 'sources.marisa')
+        self.sources_table_path = os.path.join(self.path, 'sources.table')
+        self.hits_path = os.path.join(self.path, 'hits.bin')
 
     def __repr__(self):
         return f'<{type(self).__name__}: {self.path}>'
@@ -66,8 +73,16 @@ class Metadata:
     def files_exists(self):
         return (
             os.path.exists(self.manifest_path)
-            and os.path.exists(self.digests_bloom_path)
-            and os.path.exists(self.digests_trie_path)
+            and (
+                os.path.exists(self.digests_bloom_path)
+                or os.path.exists(self.digests_mbloom_path)
+                or os.path.exists(self.digests_cuckoo_path)
+            )
+            and (
+                os.path.exists(self.digests_trie_path)
+                or os.path.exists(self.digests_map_path)
+                or os.path.exists(self.hits_path)
+            )
             and os.path.exists(self.sources_trie_path)
         )
 
@@ -89,22 +104,45 @@ class Metadata:
                 f'Cannot reach {url}: offline mode is enabled. To disable it, please unset the `CODEPROV_OFFLINE` environment variable.'
             )
 
-        with tempfile.NamedTemporaryFile() as f:
-            with tqdm(unit='B', unit_scale=True, desc=name, disable=None) as bar:
-                for response in maybe_multifile(url):
-                    for chunk in response.iter_content(32768):
-                        bar.update(len(chunk))
-                        f.write(chunk)
+        with tqdm(unit='B', unit_scale=True, desc=name, disable=None) as bar:
+            chunks = iter_chunks(url, bar)
+
+            # Extract while downloading, unless the caller needs the archive file
+            if after is None:
+                self.extract_artifact(
+                    io.BufferedReader(ChunksReader(chunks), CHUNK_SIZE)
+                )
+                return
+
+            with tempfile.NamedTemporaryFile() as f:
+                for chunk in chunks:
+                    f.write(chunk)
 
-            f.seek(0)
-            (after or self.extract_artifact)(f)
+                f.seek(0)
+                after(f)
 
     def extract_artifact(self, fileobj: BinaryIO):
         logger.info('Extract to %s', self.path)
         os.makedirs(self.path, exist_ok=True)
 
-        tar = tarfile.open(mode='r:xz', fileobj=fileobj)
-        tar.extractall(self.path, filter='data')
+        # The archive may still be downloading, so a dropped connection must
+        # not leave truncated files behind: extract aside, then move in place
+        tmp = tempfile.mkdtemp(prefix=f'.{self.name}.', dir=os.path.dirname(self.path))
+
+        try:
+            tar = tarfile.open(mode='r|xz', fileobj=fileobj)
+            tar.extractall(tmp, filter='data')
+
+            # The manifest goes last, files_exists() keys off it
+            for i in sorted(os.listdir(tmp), key=lambda i: i == 'manifest.json'):
+                dst = os.path.join(self.path, i)
+
+                if os.path.isdir(dst) and not os.path.islink(dst):
+                    shutil.rmtree(dst)
+
+                os.replace(os.path.join(tmp, i), dst)
+        finally:
+            shutil.rmtree(tmp, ignore_errors=True)
 
     def save_artifact(self, fileobj: BinaryIO, dst=''):
         filename = f'{self.name}.tar.lzma'
@@ -118,6 +156,34 @@ class Metadata:
         shutil.move(fileobj.name, path)
 
 
+class ChunksReader(io.RawIOBase):
+    def __init__(self, chunks: Iterable[bytes]):
+        self.chunks = iter(chunks)
+        self.chunk = memoryview(b'')
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        while not self.chunk:
+            if (chunk := next(self.chunks, None)) is None:
+                return 0
+
+            self.chunk = memoryview(chunk)
+
+        n = min(len(buffer), len(self.chunk))
+        buffer[:n] = self.chunk[:n]
+        self.chunk = self.chunk[n:]
+        return n
+
+
+def iter_chunks(url: str, bar: tqdm) -> Iterator[bytes]:
+    for response in maybe_multifile(url):
+        for chunk in response.iter_content(CHUNK_SIZE):
+            bar.update(len(chunk))
+            yield chunk
+
+
 def maybe_multifile(url):
     response1 = requests.get(url, stream=True)
     urls = (f'{url}.{i:02}' for i in range(100))
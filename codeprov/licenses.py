@@ -34,35 +34,53 @@ class License:
 
 
 class LicensesTrie:
+    by_id: list[License | None]
+    by_key: dict[str, License]
+    indexed: Trie | None
+
     def __init__(self, *args, **kwargs):
         self.trie = Trie(*args, **kwargs)
+        self.indexed = None
 
     def load(self, path: str, mmap=True):
         self.trie = (self.trie.mmap if mmap else self.trie.load)(path)
+        self.indexed = None
         return self
 
-    def get_license(self, spdx_key: str):
-        key = spdx_key + '\1'
-        item: tuple[str, int] | None = next(self.trie.iteritems(key), None)  # type: ignore
+    def frombytes(self, data: bytes):
+        self.trie.frombytes(data)
+        self.indexed = None
+        return self
+
+    def index(self):
+        # load() and frombytes() reset the index, a trie assigned directly to
+        # `self.trie` is noticed here
+        if self.indexed is self.trie:
+            return
 
-        if item is not None:
-            row, row_id = item
+        # Licenses are few and looked up for every match, so decode them once
+        self.indexed = self.trie
+        self.by_id = [None] * len(self.trie)
+        self.by_key = {}
+
+        for row, row_id in self.trie.items():
             spdx_key, short_name, category, *others = row.split('\1')
-            return License(row_id, spdx_key, short_name, category)
+            license = License(row_id, spdx_key, short_name, category)
+            self.by_id[row_id] = license
+            self.by_key.setdefault(spdx_key, license)
+
+    def get_license(self, spdx_key: str):
+        self.index()
+        return self.by_key.get(spdx_key)
 
     def get_license_by_id(self, id: int):
-        try:
-            row = self.trie.restore_key(id)
-        except KeyError:
-            return None
+        self.index()
 
-        spdx_key, short_name, category, *others = row.split('\1')
-        return License(id, spdx_key, short_name, category)
+        if 0 <= id < len(self.by_id):
+            return self.by_id[id]
 
 
 @cache
 def builtin_licenses_trie() -> LicensesTrie:
     file = importlib.resources.files('codeprov').joinpath('licenses.marisa').open('rb')
-    trie = LicensesTrie()
-    trie.trie.frombytes(file.read())
-    return trie
+    return LicensesTrie().frombytes(file.read())
@@ -1,26 +1,106 @@
+from array import array
 from hashlib import blake2s
 from dataclasses import dataclass
-from collections.abc import Buffer
+from collections.abc import Buffer, Iterator
 from typing import ClassVar, Self
 
 from tree_sitter import Language, Parser, Tree, Node
 from codeprov.artifact import Manifest
 
 
-@dataclass(slots=True, eq=False, init=False)
+KIND_DIGEST = 1
+KIND_SKIP = 2
+KIND_SEARCH = 4
+KIND_STATEMENT = 8
+KIND_STRING = 16
+
+
+@dataclass(slots=True, eq=False)
 class Block:
     node: Node
-    tokens: list[bytes]
+    ntokens: int
     digest: blake2s
 
-    def __init__(self, node: Node):
-        self.node = node
-        self.tokens = []
-        self.digest = blake2s(digest_size=16)
+
+class BlockStore:
+    TOP_LEVEL: ClassVar[int] = -1
+    DROPPED: ClassVar[int] = -2
+
+    nodes: list[Node]
+    parents: array
+    ntokens: array
+    pending: list[list[Buffer] | None]
+    hashers: list[blake2s]
+    digested: list[bytes | None]
+
+    def __init__(self):
+        self.nodes = []
+        self.parents = array('i')
+        self.ntokens = array('i')
+        self.pending = []
+        self.hashers = []
+        self.digested = []
+
+    def __iter__(self):
+        return (
+            bid for bid, parent in enumerate(self.parents) if parent != self.DROPPED
+        )
+
+    def add(self, node: Node, parent: int, hasher: blake2s):
+        self.nodes.append(node)
+        self.parents.append(parent)
+        self.ntokens.append(0)
+        self.pending.append([])
+        self.hashers.append(hasher)
+        self.digested.append(None)
+        return len(self.nodes) - 1
+
+    def update(self, bid: int, token: Buffer, min_tokens: int):
+        self.ntokens[bid] += 1
+
+        if (pending := self.pending[bid]) is None:
+            self.hashers[bid].update(token)
+            return
+
+        # Keep tokens aside while the block may still be merged into its parent
+        pending.append(token)
+
+        if self.ntokens[bid] >= min_tokens:
+            hasher = self.hashers[bid]
+
+            for i in pending:
+                hasher.update(i)
+
+            self.pending[bid] = None
+
+    def close(self, bid: int, min_tokens: int):
+        if self.ntokens[bid] < min_tokens:
+            parent, self.parents[bid] = self.parents[bid], self.DROPPED
+
+            if parent >= 0:
+                for i in self.pending[bid] or ():
+                    self.update(parent, i, min_tokens)
+
+            self.pending[bid] = None
+        else:
+            # No more tokens can reach a closed block, so finalize it now
+            self.digested[bid] = self.hashers[bid].digest()[:16]
+
+    def block(self, bid: int):
+        return Block(self.nodes[bid], self.ntokens[bid], self.hashers[bid])
+
+    def iter_digests(self) -> Iterator[tuple[bytes, int]]:
+        for bid, digest in enumerate(self.digested):
+            if digest is not None:
+                yield digest, bid
+
+    def digests(self):
+        return dict(self.iter_digests())
 
 
 class LanguageParser:
     classes: ClassVar[dict[str, type[Self]]] = {}
+    languages: ClassVar[dict[type[Self], Language]] = {}
     language: ClassVar[str] = 'Base'
     name: ClassVar[str] = 'block1'
 
@@ -30,12 +110,17 @@ class LanguageParser:
     search_nodes: frozenset[str] | None = None
 
     tree: Tree | None
-    blocks: dict[Block, Block | None]
+    source: memoryview | None
+    blocks: BlockStore
+    hasher_template: blake2s
 
     def __init__(self, timeout_micros=1000000):
         self.tree = None
-        self.blocks = {}
-        self.parser = Parser(Language(self.grammar()), timeout_micros=timeout_micros)
+        self.source = None
+        self.blocks = BlockStore()
+        self.parser = Parser(self.get_language(), timeout_micros=timeout_micros)
+        self.hasher_template = self.hasher()
+        self.resolve_kinds()
 
     def __init_subclass__(cls):
         if cls.language or cls.name:
@@ -58,79 +143,160 @@ class LanguageParser:
     def grammar(self) -> object:
         raise NotImplementedError
 
+    def get_language(self) -> Language:
+        if (language := self.languages.get(type(self))) is None:
+            language = self.languages[type(self)] = Language(self.grammar())
+
+        return language
+
+    def hasher(self):
+        return blake2s(digest_size=16)
+
     def display(self):
         lines = []
 
-        for block, pblock in self.blocks.items():
-            lines.append(f'{block.digest.hexdigest()} ntokens={len(block.tokens)}')
-            lines.append(repr(b''.join(block.tokens)))
+        # Show the truncated digests that datasets are keyed by
+        for digest, block in self.iter_digests():
+            lines.append(f'{digest.hex()} ntokens={block.ntokens}')
             lines.append(block.node.text.decode() + '\n')
 
         return '\n'.join(lines)
 
+    def resolve_kinds(self):
+        language = self.parser.language
+        kinds: dict[str, set[int]] = {}
+
+        # Aliases give one node type several ids, so map every id by name
+        for kind_id in range(language.node_kind_count):
+            kinds.setdefault(language.node_kind_for_id(kind_id), set()).add(kind_id)
+
+        # One byte of KIND_* flags per symbol id, ERROR nodes use id 0xFFFF
+        flags = bytearray(1 << 16)
+
+        for flag, names in (
+            (KIND_DIGEST, self.digest_nodes),
+            (KIND_SKIP, self.digest_skip_nodes),
+            (KIND_SEARCH, self.search_nodes or ()),
+            (KIND_STATEMENT, ['expression_statement']),
+            (KIND_STRING, ['string']),
+        ):
+            for name in names:
+                for kind_id in kinds.get(name, ()):
+                    flags[kind_id] |= flag
+
+        self._kinds = (self.digest_nodes, self.digest_skip_nodes, self.search_nodes)
+        self._kind_flags = bytes(flags)
+
     def parse(self, source: str | Buffer):
-        self.parser.reset()
+        kinds = self.digest_nodes, self.digest_skip_nodes, self.search_nodes
+
+        if self._kinds != kinds:
+            self.resolve_kinds()
+
+        # Only a parse that did not finish leaves state for the next one to resume
+        if self.tree is None:
+            self.parser.reset()
+
         self.tree = None
-        self.blocks = {}
+        self.source = None
+        self.blocks = BlockStore()
 
         if isinstance(source, str):
             source = source.encode()
 
         self.tree = self.parser.parse(source)
-        self.lookup(self.tree.root_node)
 
-        for i in self.blocks:
-            i.digest.update(b''.join(i.tokens))
+        # Leaf tokens are hashed straight from slices of the source, which
+        # are all released on return so callers can reuse their buffer
+        with memoryview(source) as self.source:
+            try:
+                self.lookup(self.tree.root_node)
+            finally:
+                self.source = None
 
         return self
 
     def digests(self):
-        return {i.digest.digest(): i for i in self.blocks}
+        return dict(self.iter_digests())
+
+    def iter_digests(self) -> Iterator[tuple[bytes, Block]]:
+        for digest, bid in self.blocks.iter_digests():
+            yield digest, self.blocks.block(bid)
 
     def lookup(self, node: Node):
-        for i in node.children:
-            if i.type in self.digest_nodes:
-                block = Block(i)
-                self.blocks[block] = None
-                self.lookup_compute(block, i)
+        blocks = self.blocks
+        source = self.source
+        min_nodes = self.digest_min_nodes
+        kind_flags = self._kind_flags
+        search_all = self.search_nodes is None
+        new_hasher = self.hasher_template.copy
+
+        # One frame per tree level below `node`: the block that level is
+        # digested into (None while searching) and whether leaving the level
+        # completes that block
+        cursor = node.walk()
+        frames: list[tuple[int | None, bool]] = [(None, False)]
+
+        bid = None
 
-            elif self.search_nodes is None or i.type in self.search_nodes:
-                self.lookup(i)
+        if not cursor.goto_first_child():
+            return
+
+        while True:
+            i = cursor.node
+            flags = kind_flags[i.kind_id]
+            frame = None
+
+            if bid is None:
+                if flags & KIND_DIGEST:
+                    frame = blocks.add(i, BlockStore.TOP_LEVEL, new_hasher()), True
+
+                elif search_all or flags & KIND_SEARCH:
+                    frame = None, False
 
-    def lookup_compute(self, block: Block, node: Node):
-        for i in node.children:
             # Skip orphan literals
-            if i.type == 'expression_statement' and i.child_count == 1:
-                if i.child(0).type == 'string':
-                    continue
+            elif (
+                flags & KIND_STATEMENT
+                and i.child_count == 1
+                and kind_flags[i.child(0).kind_id] & KIND_STRING
+            ):
+                pass
+
+            elif flags & KIND_SKIP:
+                pass
+
+            elif flags & KIND_SEARCH and i.descendant_count > min_nodes:
+                frame = None, False
 
-            if i.type in self.digest_skip_nodes:
-                continue
+            elif flags & KIND_DIGEST and i.descendant_count > min_nodes:
+                frame = blocks.add(i, bid, new_hasher()), True
 
-            if self.search_nodes is not None:
-                if i.type in self.search_nodes:
-                    if i.descendant_count > self.digest_min_nodes:
-                        self.lookup(i)
-                        continue
+            elif i.child_count == 0:
+                blocks.update(bid, source[i.start_byte : i.end_byte], min_nodes)
 
-            if i.type in self.digest_nodes:
-                if i.descendant_count > self.digest_min_nodes:
-                    nested_block = Block(i)
-                    self.blocks[nested_block] = block
-                    self.lookup_compute(nested_block, i)
+            else:
+                frame = bid, False
+
+            if frame is not None:
+                if cursor.goto_first_child():
+                    frames.append(frame)
+                    bid = frame[0]
                     continue
 
-            if i.child_count == 0 and i.text is not None:
-                block.tokens.append(i.text)
-                continue
+                if frame[1]:
+                    blocks.close(frame[0], min_nodes)
+
+            while not cursor.goto_next_sibling():
+                cursor.goto_parent()
+                closing, closes = frames.pop()
 
-            self.lookup_compute(block, i)
+                if closes:
+                    blocks.close(closing, min_nodes)
 
-        # Top-level call
-        if block.node is node:
-            if len(block.tokens) < self.digest_min_nodes:
-                if (parent := self.blocks.pop(block, None)) is not None:
-                    parent.tokens.extend(block.tokens)
+                if not frames:
+                    return
+
+                bid = frames[-1][0]
 
 
 class PythonParser(LanguageParser):
@@ -219,3 +385,24 @@ class JavaParser(LanguageParser):
         from tree_sitter_java import language
 
         return language()
+
+
+class Blake3Mixin:
+    name: ClassVar[str] = 'block1_b3'
+
+    def hasher(self):
+        from blake3 import blake3
+
+        return blake3()
+
+
+class PythonBlake3Parser(Blake3Mixin, PythonParser):
+    pass
+
+
+class JavaScriptBlake3Parser(Blake3Mixin, JavaScriptParser):
+    pass
+
+
+class JavaBlake3Parser(Blake3Mixin, JavaParser):
+    pass
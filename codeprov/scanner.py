@@ -1,7 +1,18 @@
+import os
+import sys
+import math
+import random
+import struct
 import warnings
 
+from array import array
+from bisect import bisect_left
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from mmap import mmap as memory_map, ACCESS_READ
 from dataclasses import dataclass
-from collections.abc import Buffer
+from collections.abc import Buffer, Collection, Iterable, Sequence
+from typing import ClassVar
 
 from rbloom import Bloom
 from marisa_trie import Trie, BinaryTrie
@@ -29,30 +40,152 @@ class Snippet:
     source: Source
 
 
+@dataclass(slots=True)
+class SnippetSpan:
+    digest: bytes
+    start_byte: int
+    end_byte: int
+    start_point: tuple[int, int]
+    end_point: tuple[int, int]
+    source: Source
+
+    @classmethod
+    def from_snippet(cls, snippet: Snippet):
+        node = snippet.block.node
+        return cls(
+            snippet.block.digest.digest()[:16],
+            node.start_byte,
+            node.end_byte,
+            tuple(node.start_point),
+            tuple(node.end_point),
+            snippet.source,
+        )
+
+
+class SourcesTable:
+    FIELDS: ClassVar[int] = 4  # repo, revision, path, licenses
+
+    count: int
+    buffer: Buffer
+    offsets: Sequence[int]
+    stars: Sequence[int]
+
+    def __init__(self):
+        self.frombuffer(memoryview(bytes(8 + self.FIELDS * 8)))
+
+    @classmethod
+    def build(cls, sources: Iterable[Source]):
+        sources = sorted(sources, key=lambda i: i.id)
+        count = sources[-1].id + 1 if sources else 0
+        columns = [[b''] * count for _ in range(cls.FIELDS)]
+        stars = array('I', bytes(4 * count))
+
+        for i in sources:
+            columns[0][i.id] = i.repo.encode()
+            columns[1][i.id] = i.revision.encode()
+            columns[2][i.id] = i.path.encode()
+            columns[3][i.id] = '\1'.join(i.licenses).encode()
+            stars[i.id] = i.stars
+
+        # Offsets are absolute positions of each value, plus one end per column
+        offsets = array('Q')
+        position = 8 + cls.FIELDS * (count + 1) * 8 + count * 4
+
+        for column in columns:
+            offsets.append(position)
+
+            for value in column:
+                position += len(value)
+                offsets.append(position)
+
+        if sys.byteorder == 'big':
+            offsets.byteswap()
+            stars.byteswap()
+
+        data = b''.join(
+            [count.to_bytes(8, 'little'), offsets.tobytes(), stars.tobytes()]
+            + [value for column in columns for value in column]
+        )
+        return cls().frombuffer(memoryview(data))
+
+    @classmethod
+    def from_trie(cls, sources: 'SourcesTrie'):
+        return cls.build(
+            parse_source(row, source_id) for row, source_id in sources.trie.items()
+        )
+
+    def load(self, path: str, mmap=True):
+        return self.frombuffer(map_file(path, mmap))
+
+    def save(self, path: str):
+        with open(path, 'wb') as f:
+            f.write(self.buffer)
+
+    def frombuffer(self, buffer: memoryview):
+        self.count = int.from_bytes(buffer[:8], 'little')
+        self.buffer = buffer
+        self.offsets = view_array(buffer, 'Q', 8, self.FIELDS * (self.count + 1))
+        self.stars = view_array(buffer, 'I', 8 + len(self.offsets) * 8, self.count)
+        return self
+
+    def get_source_by_id(self, source_id: int):
+        if not 0 <= source_id < self.count:
+            return None
+
+        # Values of one source are `stride` entries apart in the offsets
+        buffer, offsets, stride = self.buffer, self.offsets, self.count + 1
+
+        i = source_id
+        repo = str(buffer[offsets[i] : offsets[i + 1]], 'utf-8')
+        i += stride
+        revision = str(buffer[offsets[i] : offsets[i + 1]], 'utf-8')
+        i += stride
+        path = str(buffer[offsets[i] : offsets[i + 1]], 'utf-8')
+        i += stride
+        licenses = str(buffer[offsets[i] : offsets[i + 1]], 'utf-8')
+
+        return Source(
+            source_id,
+            repo,
+            revision,
+            path,
+            self.stars[source_id],
+            licenses.split('\1') if licenses else [],
+        )
+
+
 class SourcesTrie:
+    table: SourcesTable | None
+
     def __init__(self, *args, **kwargs):
         self.trie = Trie(*args, **kwargs)
+        self.table = None
 
     def load(self, path: str, mmap=True):
         self.trie = (self.trie.mmap if mmap else self.trie.load)(path)
         return self
 
+    def load_table(self, path: str, mmap=True):
+        self.table = SourcesTable().load(path, mmap)
+        return self
+
     def get_source(self, repo: str, revision: str, path: str):
         key = repo + '\1' + revision + '\1' + path + '\1'
         source, source_id = next(self.trie.iteritems(key), (None, None))
 
         if source is not None:
-            repo, revision, path, stars, *licenses = source.split('\1')
-            return Source(source_id, repo, revision, path, int(stars), licenses)
+            return parse_source(source, source_id)
 
     def get_source_by_id(self, source_id: int):
+        if self.table is not None:
+            return self.table.get_source_by_id(source_id)
+
         try:
             source = self.trie.restore_key(source_id)
         except KeyError:
             return None
 
-        repo, revision, path, stars, *licenses = source.split('\1')
-        return Source(source_id, repo, revision, path, int(stars), licenses)
+        return parse_source(source, source_id)
 
 
 class DigestsTrie:
@@ -70,20 +203,389 @@ class DigestsTrie:
             return int.from_bytes(key[-4:])
 
 
+class DigestsMap:
+    keys: Sequence[int]
+    ids: Sequence[int]
+
+    def __init__(self):
+        self.keys = array('Q')
+        self.ids = array('I')
+
+    @classmethod
+    def build(cls, items: Iterable[tuple[bytes, int]]):
+        self = cls()
+
+        for key, src_id in sorted(
+            (int.from_bytes(d[:8], 'little'), i) for d, i in items
+        ):
+            self.keys.append(key)
+            self.ids.append(src_id)
+
+        return self
+
+    @classmethod
+    def from_trie(cls, digests: DigestsTrie):
+        return cls.build(
+            (key[:8], int.from_bytes(key[-4:])) for key in digests.trie.keys()
+        )
+
+    def load(self, path: str, mmap=True):
+        # u64 keys followed by u32 ids, 12 bytes per entry
+        buffer = map_file(path, mmap)
+        n = len(buffer) // 12
+        self.keys = view_array(buffer, 'Q', 0, n)
+        self.ids = view_array(buffer, 'I', n * 8, n)
+        return self
+
+    def save(self, path: str):
+        keys = array('Q', self.keys)
+        ids = array('I', self.ids)
+
+        if sys.byteorder == 'big':
+            keys.byteswap()
+            ids.byteswap()
+
+        with open(path, 'wb') as f:
+            keys.tofile(f)
+            ids.tofile(f)
+
+    def get(self, digest: bytes):
+        key = int.from_bytes(digest[:8], 'little')
+        i = bisect_left(self.keys, key)
+
+        if i < len(self.keys) and self.keys[i] == key:
+            return self.ids[i]
+
+
+class HitsTable:
+    # Source id, stars, then byte lengths of repo, revision, path and licenses
+    RECORD: ClassVar[struct.Struct] = struct.Struct('<IIIIII')
+
+    count: int
+    buffer: Buffer
+    keys: Sequence[int]
+    offsets: Sequence[int]
+
+    def __init__(self):
+        self.frombuffer(memoryview(bytes(8)))
+
+    @classmethod
+    def build(cls, items: Iterable[tuple[bytes, Source]]):
+        # Lookups only ever see one entry per prefix, keep the lowest source
+        # id like DigestsMap does
+        best: dict[int, Source] = {}
+
+        for digest, source in items:
+            key = int.from_bytes(digest[:8], 'little')
+
+            if key not in best or source.id < best[key].id:
+                best[key] = source
+
+        entries = sorted(best.items())
+        records: dict[int, bytes] = {}
+
+        for _, source in entries:
+            if source.id not in records:
+                fields = [
+                    source.repo.encode(),
+                    source.revision.encode(),
+                    source.path.encode(),
+                    '\1'.join(source.licenses).encode(),
+                ]
+                records[source.id] = cls.RECORD.pack(
+                    source.id, source.stars, *map(len, fields)
+                ) + b''.join(fields)
+
+        # Each digest entry points at the absolute offset of its source record
+        positions = {}
+        position = 8 + len(entries) * 16
+
+        for source_id, record in records.items():
+            positions[source_id] = position
+            position += len(record)
+
+        keys = array('Q', [key for key, _ in entries])
+        offsets = array('Q', [positions[source.id] for _, source in entries])
+
+        if sys.byteorder == 'big':
+            keys.byteswap()
+            offsets.byteswap()
+
+        data = b''.join(
+            [len(entries).to_bytes(8, 'little'), keys.tobytes(), offsets.tobytes()]
+            + list(records.values())
+        )
+        return cls().frombuffer(memoryview(data))
+
+    @classmethod
+    def from_tables(cls, digests: DigestsTrie | DigestsMap, sources: SourcesTrie):
+        if isinstance(digests, DigestsMap):
+            items = zip((i.to_bytes(8, 'little') for i in digests.keys), digests.ids)
+        else:
+            items = ((key[:8], int.from_bytes(key[-4:])) for key in digests.trie.keys())
+
+        return cls.build(
+            (digest, source)
+            for digest, source_id in items
+            if (source := sources.get_source_by_id(source_id)) is not None
+        )
+
+    def load(self, path: str, mmap=True):
+        return self.frombuffer(map_file(path, mmap))
+
+    def save(self, path: str):
+        with open(path, 'wb') as f:
+            f.write(self.buffer)
+
+    def frombuffer(self, buffer: memoryview):
+        self.count = int.from_bytes(buffer[:8], 'little')
+        self.buffer = buffer
+        self.keys = view_array(buffer, 'Q', 8, self.count)
+        self.offsets = view_array(buffer, 'Q', 8 + self.count * 8, self.count)
+        return self
+
+    def get_source(self, digest: bytes):
+        key = int.from_bytes(digest[:8], 'little')
+        i = bisect_left(self.keys, key)
+
+        if i == self.count or self.keys[i] != key:
+            return None
+
+        buffer, offset = self.buffer, self.offsets[i]
+        source_id, stars, *lengths = self.RECORD.unpack_from(buffer, offset)
+        offset += self.RECORD.size
+        fields = []
+
+        for n in lengths:
+            fields.append(str(buffer[offset : offset + n], 'utf-8'))
+            offset += n
+
+        repo, revision, path, licenses = fields
+        return Source(
+            source_id,
+            repo,
+            revision,
+            path,
+            stars,
+            licenses.split('\1') if licenses else [],
+        )
+
+
+class MmapBloom:
+    k: int
+    size: int
+    bits: Buffer
+
+    def __init__(self):
+        self.k = 1
+        self.size = 8
+        self.bits = bytearray(1)
+
+    @classmethod
+    def build(cls, digests: Collection[bytes], error_rate=0.01):
+        n = max(len(digests), 1)
+
+        self = cls()
+        self.size = max(math.ceil(-n * math.log(error_rate) / math.log(2) ** 2), 8)
+        self.k = max(round(self.size / n * math.log(2)), 1)
+        self.bits = bits = bytearray((self.size + 7) // 8)
+
+        for digest in digests:
+            for i in self.probes(digest):
+                bits[i >> 3] |= 1 << (i & 7)
+
+        return self
+
+    @classmethod
+    def from_digests(cls, digests: DigestsTrie | DigestsMap, error_rate=0.01):
+        return cls.build(digest_prefixes(digests), error_rate)
+
+    def load(self, path: str, mmap=True):
+        # Little-endian u64 hash count and bit count, then the bit array
+        buffer = map_file(path, mmap)
+        self.k, self.size = struct.unpack_from('<QQ', buffer)
+        self.bits = buffer[16:]
+        return self
+
+    def save(self, path: str):
+        with open(path, 'wb') as f:
+            f.write(struct.pack('<QQ', self.k, self.size))
+            f.write(self.bits)
+
+    def probes(self, digest: bytes):
+        # Double hashing over the digest prefix the digests table is keyed by
+        key = int.from_bytes(digest[:8], 'little')
+        step = (key >> 32 | key << 32) & 0xFFFFFFFFFFFFFFFF | 1
+
+        for _ in range(self.k):
+            yield key % self.size
+            key += step
+
+    def __contains__(self, digest: bytes):
+        bits = self.bits
+
+        for i in self.probes(digest):
+            if not bits[i >> 3] >> (i & 7) & 1:
+                return False
+
+        return True
+
+    def filter(self, digests: Iterable[bytes]) -> list[bytes]:
+        bits, k, size = self.bits, self.k, self.size
+        found = []
+
+        for digest in digests:
+            key = int.from_bytes(digest[:8], 'little')
+            step = (key >> 32 | key << 32) & 0xFFFFFFFFFFFFFFFF | 1
+
+            for _ in range(k):
+                i = key % size
+
+                if not bits[i >> 3] >> (i & 7) & 1:
+                    break
+
+                key += step
+            else:
+                found.append(digest)
+
+        return found
+
+
+class CuckooFilter:
+    SLOTS: ClassVar[int] = 4
+
+    buckets: int
+    table: Sequence[int]
+
+    def __init__(self):
+        self.buckets = 1
+        self.table = array('H', bytes(2 * self.SLOTS))
+
+    @classmethod
+    def build(cls, digests: Collection[bytes], max_kicks=500, max_grows=8):
+        # Repeated prefixes share a fingerprint and both buckets, so more than
+        # 2 * SLOTS copies of one would never fit at any size
+        prefixes = sorted({i[:8] for i in digests})
+
+        # Power-of-two bucket counts keep the alternate bucket an XOR away
+        buckets = max(math.ceil(len(prefixes) / cls.SLOTS / 0.9), 1)
+        buckets = 1 << (buckets - 1).bit_length()
+        rng = random.Random(0)
+
+        for _ in range(max_grows + 1):
+            self = cls()
+            self.buckets = buckets
+            self.table = array('H', bytes(2 * cls.SLOTS * buckets))
+
+            if all(self.add(i, rng, max_kicks) for i in prefixes):
+                return self
+
+            buckets *= 2
+
+        raise ValueError(
+            f'Cannot fit {len(prefixes)} digests into a cuckoo filter '
+            f'of {buckets // 2} buckets'
+        )
+
+    @classmethod
+    def from_digests(cls, digests: DigestsTrie | DigestsMap):
+        return cls.build(digest_prefixes(digests))
+
+    def load(self, path: str, mmap=True):
+        # Little-endian u64 bucket count and slots per bucket, then u16 fingerprints
+        buffer = map_file(path, mmap)
+        self.buckets, slots = struct.unpack_from('<QQ', buffer)
+
+        if slots != self.SLOTS:
+            raise ValueError(f'Unsupported cuckoo filter with {slots} slots per bucket')
+
+        self.table = view_array(buffer, 'H', 16, self.buckets * self.SLOTS)
+        return self
+
+    def save(self, path: str):
+        table = array('H', self.table)
+
+        if sys.byteorder == 'big':
+            table.byteswap()
+
+        with open(path, 'wb') as f:
+            f.write(struct.pack('<QQ', self.buckets, self.SLOTS))
+            table.tofile(f)
+
+    def locate(self, digest: bytes):
+        # Low bits of the digest prefix pick the bucket, the top 16 bits are
+        # the fingerprint (0 marks an empty slot)
+        key = int.from_bytes(digest[:8], 'little')
+        return key & (self.buckets - 1), key >> 48 or 1
+
+    def alternate(self, bucket: int, fingerprint: int):
+        return (bucket ^ fingerprint * 0x5BD1E995) & (self.buckets - 1)
+
+    def add(self, digest: bytes, rng: random.Random, max_kicks=500):
+        table = self.table
+        bucket, fingerprint = self.locate(digest)
+
+        for _ in range(max_kicks):
+            for i in (bucket, self.alternate(bucket, fingerprint)):
+                for slot in range(i * self.SLOTS, (i + 1) * self.SLOTS):
+                    if not table[slot]:
+                        table[slot] = fingerprint
+                        return True
+
+            # Both buckets are full: evict an entry and move it to its other bucket
+            slot = bucket * self.SLOTS + rng.randrange(self.SLOTS)
+            fingerprint, table[slot] = table[slot], fingerprint
+            bucket = self.alternate(bucket, fingerprint)
+
+        return False
+
+    def __contains__(self, digest: bytes):
+        key = int.from_bytes(digest[:8], 'little')
+        mask, slots, table = self.buckets - 1, self.SLOTS, self.table
+        fingerprint = key >> 48 or 1
+        i = (key & mask) * slots
+        j = ((key & mask ^ fingerprint * 0x5BD1E995) & mask) * slots
+        return (
+            fingerprint in table[i : i + slots] or fingerprint in table[j : j + slots]
+        )
+
+    def filter(self, digests: Iterable[bytes]) -> list[bytes]:
+        mask, slots, table = self.buckets - 1, self.SLOTS, self.table
+        found = []
+
+        for digest in digests:
+            key = int.from_bytes(digest[:8], 'little')
+            fingerprint = key >> 48 or 1
+            i = (key & mask) * slots
+            j = ((key & mask ^ fingerprint * 0x5BD1E995) & mask) * slots
+
+            if (
+                fingerprint in table[i : i + slots]
+                or fingerprint in table[j : j + slots]
+            ):
+                found.append(digest)
+
+        return found
+
+
 class Scanner:
     def __init__(
         self,
         parser: LanguageParser,
         sources: SourcesTrie,
-        digests: DigestsTrie,
-        digests_bloom: Bloom,
+        digests: DigestsTrie | DigestsMap | None,
+        digests_bloom: Bloom | MmapBloom | CuckooFilter,
         metadata: Metadata | None = None,
+        options: dict | None = None,
+        hits: HitsTable | None = None,
     ):
         self.parser = parser
         self.sources = sources
         self.digests = digests
         self.digests_bloom = digests_bloom
         self.metadata = metadata
+        self.options = options or {}
+        self.hits = hits
 
     def __repr__(self):
         return f'<{type(self).__name__} parser={self.parser}>'
@@ -95,6 +597,7 @@ class Scanner:
         parser_timeout_micros=1000000,
         sources_mmap=True,
         digests_mmap=True,
+        bloom_mmap=True,
         offline=False,
         url: str | None = None,
     ):
@@ -106,12 +609,31 @@ class Scanner:
                     f'Cannot download {name} dataset: offline mode is enabled.'
                 )
 
-            metadata.download_artifact(url=url, after=metadata.extract_artifact)
+            metadata.download_artifact(url=url)
 
         manifest = metadata.load_manifest()
         sources = SourcesTrie().load(metadata.sources_trie_path, sources_mmap)
-        digests = DigestsTrie().load(metadata.digests_trie_path, digests_mmap)
-        digests_bloom = Bloom.load(metadata.digests_bloom_path, bloom_hash)
+
+        if os.path.exists(metadata.sources_table_path):
+            sources.load_table(metadata.sources_table_path, sources_mmap)
+
+        hits = digests = None
+
+        if os.path.exists(metadata.hits_path):
+            hits = HitsTable().load(metadata.hits_path, digests_mmap)
+        elif os.path.exists(metadata.digests_map_path):
+            digests = DigestsMap().load(metadata.digests_map_path, digests_mmap)
+        else:
+            digests = DigestsTrie().load(metadata.digests_trie_path, digests_mmap)
+
+        if os.path.exists(metadata.digests_cuckoo_path):
+            digests_bloom = CuckooFilter().load(
+                metadata.digests_cuckoo_path, bloom_mmap
+            )
+        elif os.path.exists(metadata.digests_mbloom_path):
+            digests_bloom = MmapBloom().load(metadata.digests_mbloom_path, bloom_mmap)
+        else:
+            digests_bloom = Bloom.load(metadata.digests_bloom_path, bloom_hash)
 
         parser = LanguageParser.get_class(manifest.language, manifest.parser)(
             parser_timeout_micros
@@ -124,24 +646,134 @@ class Scanner:
             digests=digests,
             digests_bloom=digests_bloom,
             metadata=metadata,
+            options=dict(
+                parser_timeout_micros=parser_timeout_micros,
+                sources_mmap=sources_mmap,
+                digests_mmap=digests_mmap,
+                bloom_mmap=bloom_mmap,
+            ),
+            hits=hits,
         )
 
     def scan(self, source: str | Buffer):
-        for digest, block in self.parser.parse(source).digests().items():
-            if digest not in self.digests_bloom:
-                continue
+        blocks = self.parser.parse(source).blocks
+        bids: dict[bytes, int] = {}
 
-            if (src_id := self.digests.get(digest[:8])) is None:
-                continue
+        # Report the first block of a digest repeated within the file
+        for digest, bid in blocks.iter_digests():
+            bids.setdefault(digest, bid)
 
-            if (source := self.sources.get_source_by_id(src_id)) is None:
-                warnings.warn(
-                    f'Digest {block.digest.hexdigest()} found, but corresponding attribution entry missing.'
-                )
-                continue
+        # Sweep the unique digests through the prefilter in one batch, only
+        # the few hits go on to the digests and sources tables
+        for digest in filter_digests(self.digests_bloom, bids):
+            if (source := self.get_source(digest)) is not None:
+                yield Snippet(block=blocks.block(bids[digest]), source=source)
+
+    def get_source(self, digest: bytes):
+        if self.hits is not None:
+            return self.hits.get_source(digest)
+
+        if (src_id := self.digests.get(digest[:8])) is None:
+            return None
+
+        if (source := self.sources.get_source_by_id(src_id)) is None:
+            warnings.warn(
+                f'Digest {digest.hex()} found, but corresponding attribution entry missing.'
+            )
+
+        return source
+
+    def scan_many(self, paths: Iterable[str], workers: int | None = None, chunksize=16):
+        if self.metadata is None:
+            raise ValueError(
+                'scan_many() requires a scanner loaded by from_dataset_name()'
+            )
+
+        # Each worker maps the same dataset files, so they share the page cache
+        with ProcessPoolExecutor(
+            max_workers=workers or os.cpu_count(),
+            initializer=scan_worker_init,
+            initargs=(self.metadata.path, self.options),
+        ) as executor:
+            # One unreadable or unparsable file must not end the whole batch
+            results = executor.map(scan_worker, paths, chunksize=chunksize)
+
+            # map() submits every chunk up front, so a caller that stops early
+            # must not wait for the rest of the batch on exit
+            try:
+                for path, spans, error in results:
+                    if error is not None:
+                        warnings.warn(f'Failed to scan {path}: {error}')
+
+                    yield path, spans
+            finally:
+                executor.shutdown(cancel_futures=True)
+
+
+worker_scanner: Scanner | None = None
+
+
+def scan_worker_init(name: str, options: dict):
+    global worker_scanner
+    worker_scanner = Scanner.from_dataset_name(name, offline=True, **options)
+
+
+def scan_worker(path: str) -> tuple[str, list[SnippetSpan], str | None]:
+    try:
+        with open(path, 'rb') as f:
+            source = f.read()
+
+        spans = [SnippetSpan.from_snippet(i) for i in worker_scanner.scan(source)]
+    except (OSError, ValueError) as e:
+        return path, [], f'{type(e).__name__}: {e}'
+
+    return path, spans, None
+
+
+def parse_source(row: str, source_id: int):
+    repo, revision, path, stars, *licenses = row.split('\1')
+    return Source(source_id, repo, revision, path, int(stars), licenses)
+
+
+def digest_prefixes(digests: DigestsTrie | DigestsMap) -> list[bytes]:
+    # Several sources can share a prefix, filters only need each one once
+    if isinstance(digests, DigestsMap):
+        return sorted({i.to_bytes(8, 'little') for i in digests.keys})
+
+    return sorted({key[:8] for key in digests.trie.keys()})
+
+
+def filter_digests(
+    bloom: Bloom | MmapBloom | CuckooFilter, digests: Iterable[bytes]
+) -> list[bytes]:
+    if isinstance(bloom, Bloom):
+        return [i for i in digests if i in bloom]
+
+    return bloom.filter(digests)
+
+
+def map_file(path: str, mmap=True) -> memoryview:
+    with open(path, 'rb') as f:
+        if mmap and os.fstat(f.fileno()).st_size:
+            return memoryview(memory_map(f.fileno(), 0, access=ACCESS_READ))
+
+        return memoryview(f.read())
+
+
+def view_array(
+    buffer: memoryview, typecode: str, start: int, count: int
+) -> Sequence[int]:
+    # Artifacts are little-endian, so only big-endian hosts need a copy
+    end = start + count * array(typecode).itemsize
+
+    if sys.byteorder == 'little':
+        return buffer[start:end].cast(typecode)
 
-            yield Snippet(block=block, source=source)
+    items = array(typecode, buffer[start:end])
+    items.byteswap()
+    return items
 
 
-def bloom_hash(digest: bytes):
-    return int.from_bytes(digest[:16], 'big', signed=True)
+# Digests are 16 bytes, so the bloom key is the whole digest as a signed
+# 128-bit integer. A partial keeps rbloom's per-probe callback in C.
+bloom_hash = partial(int.from_bytes, byteorder='big', signed=True)
@@ -0,0 +1,86 @@
+import pytest
+
+from marisa_trie import Trie, BinaryTrie
+from rbloom import Bloom
+
+from codeprov.parser import PythonParser
+from codeprov.scanner import SourcesTrie, DigestsTrie, bloom_hash
+
+
+def make_function(name: str, seed: int):
+    return (
+        f'def {name}(items, limit={seed}):\n'
+        f'    total = {seed}\n'
+        f'    for i, item in enumerate(items):\n'
+        f'        if item > limit * {seed + 1}:\n'
+        f'            total += item // {seed + 2} - i\n'
+        f'        else:\n'
+        f'            total -= process_{seed}(item, i, limit)\n'
+        f'    return total\n'
+    )
+
+
+def make_module(*seeds: int):
+    return '\n\n'.join(make_function(f'function_{i}', i) for i in seeds)
+
+
+# Seed 1 appears in two modules, so some digest prefixes have two sources
+MODULES = [
+    make_module(1, 2, 3),
+    make_module(4, 1),
+    make_module(5, 6),
+]
+
+
+def make_row(i: int):
+    licenses = ['MIT', 'Apache-2.0'] if i % 2 else []
+    return '\1'.join(
+        [f'org/repo{i}', f'{i:040x}', f'src/module{i}.py', str(i * 10)] + licenses
+    )
+
+
+@pytest.fixture(scope='session')
+def parser():
+    parser = PythonParser()
+    parser.search_nodes = None
+    return parser
+
+
+@pytest.fixture(scope='session')
+def sources_trie():
+    sources = SourcesTrie()
+    sources.trie = Trie([make_row(i) for i in range(len(MODULES))])
+    return sources
+
+
+@pytest.fixture(scope='session')
+def sources(sources_trie):
+    return [sources_trie.get_source_by_id(i) for i in range(len(sources_trie.trie))]
+
+
+@pytest.fixture(scope='session')
+def digests(parser, sources_trie):
+    # (digest, source id) pairs, as the legacy tries store them
+    items = []
+
+    for i, module in enumerate(MODULES):
+        source_id = sources_trie.trie[make_row(i)]
+
+        for digest in parser.parse(module).digests():
+            items.append((digest, source_id))
+
+    return items
+
+
+@pytest.fixture(scope='session')
+def digests_trie(digests):
+    trie = DigestsTrie()
+    trie.trie = BinaryTrie([digest[:8] + i.to_bytes(4, 'big') for digest, i in digests])
+    return trie
+
+
+@pytest.fixture(scope='session')
+def bloom(digests):
+    bloom = Bloom(len(digests), 0.01, bloom_hash)
+    bloom.update(digest for digest, _ in digests)
+    return bloom
@@ -0,0 +1,127 @@
+import random
+
+import pytest
+
+from codeprov.scanner import (
+    Source,
+    SourcesTable,
+    DigestsMap,
+    HitsTable,
+    MmapBloom,
+    CuckooFilter,
+    digest_prefixes,
+)
+
+
+def roundtrip(table, tmp_path, mmap: bool):
+    path = tmp_path / 'table.bin'
+    table.save(path)
+    return type(table)().load(path, mmap)
+
+
+@pytest.fixture
+def misses(digests):
+    rng = random.Random(0)
+    known = {digest[:8] for digest, _ in digests}
+    return [i for i in (rng.randbytes(16) for _ in range(2000)) if i[:8] not in known]
+
+
+@pytest.fixture(params=[True, False], ids=['mmap', 'read'])
+def mmap(request):
+    return request.param
+
+
+def test_digests_map(digests, digests_trie, misses, tmp_path, mmap):
+    table = roundtrip(DigestsMap.from_trie(digests_trie), tmp_path, mmap)
+    assert list(table.keys) == list(DigestsMap.build(digests).keys)
+
+    for digest, _ in digests:
+        assert table.get(digest[:8]) == digests_trie.get(digest[:8])
+
+    for digest in misses:
+        assert table.get(digest[:8]) is None
+
+
+def test_digests_map_empty(misses, tmp_path, mmap):
+    table = roundtrip(DigestsMap(), tmp_path, mmap)
+    assert table.get(misses[0][:8]) is None
+
+
+def test_sources_table(sources, sources_trie, tmp_path, mmap):
+    table = roundtrip(SourcesTable.from_trie(sources_trie), tmp_path, mmap)
+    assert table.count == len(sources)
+
+    for source in sources:
+        assert table.get_source_by_id(source.id) == source
+
+    assert table.get_source_by_id(-1) is None
+    assert table.get_source_by_id(len(sources)) is None
+
+
+def test_sources_table_empty(tmp_path, mmap):
+    table = roundtrip(SourcesTable(), tmp_path, mmap)
+    assert table.count == 0
+    assert table.get_source_by_id(0) is None
+
+
+def test_hits_table(digests, digests_trie, sources_trie, misses, tmp_path, mmap):
+    table = roundtrip(HitsTable.from_tables(digests_trie, sources_trie), tmp_path, mmap)
+    assert table.count == len({digest[:8] for digest, _ in digests})
+
+    for digest, _ in digests:
+        source_id = digests_trie.get(digest[:8])
+        assert table.get_source(digest) == sources_trie.get_source_by_id(source_id)
+
+    for digest in misses:
+        assert table.get_source(digest) is None
+
+
+def test_hits_table_long_fields(tmp_path, mmap):
+    source = Source(7, 'org/repo', 'main', 'a/' * 40000, 1, ['MIT', 'x' * 70000])
+    table = roundtrip(HitsTable.build([(b'\1' * 16, source)]), tmp_path, mmap)
+    assert table.get_source(b'\1' * 16) == source
+
+
+def test_hits_table_empty(misses, tmp_path, mmap):
+    table = roundtrip(HitsTable(), tmp_path, mmap)
+    assert table.count == 0
+    assert table.get_source(misses[0]) is None
+
+
+@pytest.mark.parametrize('cls', [MmapBloom, CuckooFilter])
+def test_prefilter(cls, digests, digests_trie, misses, tmp_path, mmap):
+    prefilter = roundtrip(cls.from_digests(digests_trie), tmp_path, mmap)
+    members = [digest for digest, _ in digests]
+
+    assert all(digest in prefilter for digest in members)
+    assert prefilter.filter(members) == members
+
+    false_positives = prefilter.filter(misses)
+    assert false_positives == [digest for digest in misses if digest in prefilter]
+    assert len(false_positives) < len(misses) * 0.05
+
+
+@pytest.mark.parametrize('cls', [MmapBloom, CuckooFilter])
+def test_prefilter_empty(cls, misses, tmp_path, mmap):
+    prefilter = roundtrip(cls(), tmp_path, mmap)
+    assert prefilter.filter(misses) == []
+
+
+def test_digest_prefixes_unique(digests, digests_trie):
+    prefixes = digest_prefixes(digests_trie)
+    assert prefixes == sorted({digest[:8] for digest, _ in digests})
+    assert digest_prefixes(DigestsMap.from_trie(digests_trie)) == prefixes
+
+
+def test_cuckoo_filter_repeated_prefixes(digests):
+    members = [digest for digest, _ in digests]
+    prefilter = CuckooFilter.build(members + [members[0]] * 8)
+    assert prefilter.filter(members) == members
+
+
+def test_cuckoo_filter_bounded_growth():
+    # Same bucket bits and fingerprint at every size tried
+    colliding = [(i << 20).to_bytes(8, 'little') for i in range(1, 10)]
+
+    with pytest.raises(ValueError):
+        CuckooFilter.build(colliding, max_grows=2)
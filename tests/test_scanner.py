@@ -0,0 +1,104 @@
+import json
+
+import pytest
+
+from codeprov.scanner import (
+    Scanner,
+    SourcesTrie,
+    SourcesTable,
+    DigestsMap,
+    HitsTable,
+    MmapBloom,
+    CuckooFilter,
+)
+
+from conftest import MODULES, make_module
+
+
+# A file copying functions 1 and 5 next to code that is in no source
+SCANNED = '\n\n'.join([make_module(7), MODULES[1], make_module(8, 5)])
+
+
+def scan(scanner: Scanner):
+    return [
+        (snippet.block.node.start_byte, snippet.source)
+        for snippet in scanner.scan(SCANNED)
+    ]
+
+
+@pytest.fixture
+def expected(parser, sources_trie, digests_trie, bloom):
+    snippets = scan(Scanner(parser, sources_trie, digests_trie, bloom))
+    # Functions 4 and 1 come from module 1, function 5 from module 2
+    assert len(snippets) == 3
+    return snippets
+
+
+@pytest.fixture
+def dataset(tmp_path, sources_trie, digests_trie, bloom):
+    def write(*layout: str):
+        path = tmp_path / '_'.join(layout)
+        path.mkdir()
+
+        with open(path / 'manifest.json', 'w') as f:
+            json.dump({'language': 'Python', 'parser': 'block1', 'sample': 'test'}, f)
+
+        sources_trie.trie.save(str(path / 'sources.marisa'))
+
+        if 'trie' in layout:
+            digests_trie.trie.save(str(path / 'digests.marisa'))
+        if 'map' in layout:
+            DigestsMap.from_trie(digests_trie).save(path / 'digests.map')
+        if 'hits' in layout:
+            hits = HitsTable.from_tables(digests_trie, sources_trie)
+            hits.save(path / 'hits.bin')
+        if 'table' in layout:
+            SourcesTable.from_trie(sources_trie).save(path / 'sources.table')
+        if 'bloom' in layout:
+            bloom.save(str(path / 'digests.bloom'))
+        if 'mbloom' in layout:
+            MmapBloom.from_digests(digests_trie).save(path / 'digests.mbloom')
+        if 'cuckoo' in layout:
+            CuckooFilter.from_digests(digests_trie).save(path / 'digests.cuckoo')
+
+        return str(path)
+
+    return write
+
+
+@pytest.mark.parametrize(
+    'layout',
+    [
+        ('trie', 'bloom'),
+        ('map', 'bloom'),
+        ('map', 'mbloom'),
+        ('map', 'table', 'mbloom'),
+        ('map', 'table', 'cuckoo'),
+        ('trie', 'cuckoo'),
+        ('hits', 'cuckoo'),
+    ],
+    ids='_'.join,
+)
+def test_scan_matches_legacy_dataset(layout, dataset, expected):
+    scanner = Scanner.from_dataset_name(dataset(*layout), offline=True)
+    assert scan(scanner) == expected
+
+
+def test_scan_with_tables(parser, sources_trie, digests_trie, expected):
+    sources = SourcesTrie()
+    sources.trie = sources_trie.trie
+    sources.table = SourcesTable.from_trie(sources_trie)
+
+    scanner = Scanner(
+        parser,
+        sources,
+        DigestsMap.from_trie(digests_trie),
+        CuckooFilter.from_digests(digests_trie),
+    )
+    assert scan(scanner) == expected
+
+    hits = HitsTable.from_tables(digests_trie, sources_trie)
+    scanner = Scanner(
+        parser, sources, None, MmapBloom.from_digests(digests_trie), hits=hits
+    )
+    assert scan(scanner) == expected